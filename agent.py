@@ -1,182 +1,237 @@
-import os
-from dotenv import load_dotenv
-from pathlib import Path
-
-# Add references
-from azure.identity import DefaultAzureCredential
-from azure.ai.projects import AIProjectClient
-from azure.ai.projects.models import (
-    PromptAgentDefinition,
-    CodeInterpreterTool,
-    CodeInterpreterToolAuto,
-)
-
-
-def main():
-
-    # Clear the console
-    os.system("cls" if os.name == "nt" else "clear")
-
-    # Load environment variables from .env file
-    load_dotenv()
-    project_endpoint = os.getenv("PROJECT_ENDPOINT")
-    model_deployment = os.getenv("MODEL_DEPLOYMENT_NAME")
-
-    # Ask the user for their budget
-    while True:
-        try:
-            budget = float(input("Enter your budget (in USD): "))
-            break
-        except ValueError:
-            print("Please enter a valid number.")
-
-    # Connect to the AI Project and OpenAI clients
-    script_dir = Path(__file__).parent
-    file_path = script_dir / "phones.csv"
-
-    with (
-        DefaultAzureCredential(
-            exclude_environment_credential=True,
-            exclude_managed_identity_credential=True,
-        ) as credential,
-        AIProjectClient(endpoint=project_endpoint, credential=credential) as project_client,
-        project_client.get_openai_client() as openai_client,
-    ):
-
-        # Upload the phones.csv file and create a CodeInterpreterTool
-        uploaded_file = openai_client.files.create(
-            file=open(file_path, "rb"),
-            purpose="assistants",
-        )
-        print(f"Uploaded {uploaded_file.filename}")
-
-        code_interpreter = CodeInterpreterTool(
-            container=CodeInterpreterToolAuto(file_ids=[uploaded_file.id])
-        )
-
-        # Define an agent that uses the CodeInterpreterTool
-        agent = project_client.agents.create_version(
-            agent_name="phone-budget-agent",
-            definition=PromptAgentDefinition(
-                model=model_deployment,
-                instructions=(
-                    "You are a helpful shopping assistant. "
-                    "You have access to a CSV file containing phone data including names and prices. "
-                    "When given a budget, use Python to read the CSV file and filter phones "
-                    "that are priced below or equal to that budget. "
-                    "Present the results in a clear, readable format showing the phone name and price."
-                ),
-                tools=[code_interpreter],
-            ),
-        )
-
-        print(f"Using agent: {agent.name}")
-
-        # Create a conversation for the chat session
-        conversation = openai_client.conversations.create()
-
-        # Send the initial budget-based query automatically
-        initial_prompt = (
-            f"My budget is ${budget:.2f}. "
-            f"Please read the phones.csv file and list all phones that cost less than or equal to ${budget:.2f}. "
-            f"Show the phone name and price for each result, sorted by price."
-        )
-
-        print(f"\nYou: {initial_prompt}\n")
-
-        # Send user message
-        openai_client.conversations.items.create(
-            conversation_id=conversation.id,
-            items=[
-                {
-                    "type": "message",
-                    "role": "user",
-                    "content": initial_prompt,
-                }
-            ],
-        )
-
-        # Get response
-        response = openai_client.responses.create(
-            conversation=conversation.id,
-            extra_body={
-                "agent": {"name": agent.name, "type": "agent_reference"}
-            },
-            input="",
-        )
-
-        # Check for failure
-        if response.status == "failed":
-            print(f"Response failed: {response.error}")
-        else:
-            print(f"Agent: {response.output_text}")
-
-        # Continue with follow-up questions in a loop
-        while True:
-
-            user_prompt = input("\nAny follow-up questions? (or type 'quit' to exit): ")
-
-            if user_prompt.lower() == "quit":
-                break
-
-            if len(user_prompt) == 0:
-                print("Please enter a prompt.")
-                continue
-
-            # Send user message
-            openai_client.conversations.items.create(
-                conversation_id=conversation.id,
-                items=[
-                    {
-                        "type": "message",
-                        "role": "user",
-                        "content": user_prompt,
-                    }
-                ],
-            )
-
-            # Get response
-            response = openai_client.responses.create(
-                conversation=conversation.id,
-                extra_body={
-                    "agent": {"name": agent.name, "type": "agent_reference"}
-                },
-                input="",
-            )
-
-            # Check for failure
-            if response.status == "failed":
-                print(f"Response failed: {response.error}")
-                continue
-
-            # Show agent response
-            print(f"Agent: {response.output_text}")
-
-        # Conversation log
-        print("\nConversation Log:\n")
-
-        items = openai_client.conversations.items.list(
-            conversation_id=conversation.id
-        )
-
-        for item in items:
-            if item.type == "message":
-                role = item.role.upper()
-                content = item.content[0].text
-                print(f"{role}: {content}\n")
-
-        # Clean up
-        openai_client.conversations.delete(
-            conversation_id=conversation.id
-        )
-        print("Conversation deleted")
-
-        project_client.agents.delete_version(
-            agent_name=agent.name,
-            agent_version=agent.version,
-        )
-        print("Agent deleted")
-
-
-if __name__ == "__main__":
-    main()
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, NotFoundError
+from pathlib import Path
+
+# Add references
+from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import (
+    PromptAgentDefinition,
+    CodeInterpreterTool,
+    CodeInterpreterToolAuto,
+)
+
+
+async def upload_phone_data(openai_client, file_path):
+    """Upload phones.csv, reusing a previous upload if the file is unchanged."""
+
+    cache_path = file_path.parent / ".agent_cache.json"
+    file_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    try:
+        cache = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        cache = {}
+
+    file_id = cache.get(file_hash)
+    if file_id:
+        try:
+            return await openai_client.files.retrieve(file_id)
+        except NotFoundError:
+            # The cached file no longer exists on the service; re-upload
+            pass
+
+    with open(file_path, "rb") as f:
+        uploaded_file = await openai_client.files.create(file=f, purpose="assistants")
+
+    cache_path.write_text(json.dumps({file_hash: uploaded_file.id}))
+    return uploaded_file
+
+
+async def fetch_conversation_log(openai_client, conversation_id):
+    """Collect all items of a conversation for the end-of-session log."""
+
+    # Fetch the log in large pages to keep the number of round-trips low
+    items = []
+    async for item in openai_client.conversations.items.list(
+        conversation_id=conversation_id,
+        limit=100,
+    ):
+        items.append(item)
+    return items
+
+
+async def stream_response(openai_client, agent, conversation_id, user_prompt):
+    """Send a user message and stream the agent's reply to stdout."""
+
+    # Send the user message and get the response in a single call,
+    # streaming the output as it is generated. Use create(stream=True)
+    # rather than the stream() helper: the helper insists on an explicit
+    # model, while here the server resolves it from the agent reference.
+    stream = await openai_client.responses.create(
+        conversation=conversation_id,
+        extra_body={
+            "agent": {"name": agent.name, "type": "agent_reference"}
+        },
+        input=[
+            {
+                "type": "message",
+                "role": "user",
+                "content": user_prompt,
+            }
+        ],
+        stream=True,
+    )
+
+    print("Agent: ", end="", flush=True)
+    response = None
+    async for event in stream:
+        if event.type == "response.output_text.delta":
+            sys.stdout.write(event.delta)
+            sys.stdout.flush()
+        elif event.type in ("response.completed", "response.failed", "response.incomplete"):
+            response = event.response
+    print()
+    return response
+
+
+async def main():
+
+    # Clear the console
+    os.system("cls" if os.name == "nt" else "clear")
+
+    # Load environment variables from .env file
+    load_dotenv()
+    project_endpoint = os.getenv("PROJECT_ENDPOINT")
+    model_deployment = os.getenv("MODEL_DEPLOYMENT_NAME")
+
+    # Ask the user for their budget
+    while True:
+        try:
+            budget = float(input("Enter your budget (in USD): "))
+            break
+        except ValueError:
+            print("Please enter a valid number.")
+
+    # Connect to the AI Project and OpenAI clients
+    script_dir = Path(__file__).parent
+    file_path = script_dir / "phones.csv"
+
+    async with (
+        DefaultAzureCredential(
+            exclude_environment_credential=True,
+            exclude_managed_identity_credential=True,
+        ) as credential,
+        AIProjectClient(endpoint=project_endpoint, credential=credential) as project_client,
+        # Share one keep-alive HTTP/2 connection pool across all API calls
+        # so each turn reuses the TCP + TLS session instead of redoing the
+        # handshake
+        httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=300.0),
+        ) as http_client,
+        # get_openai_client offers no way to inject a custom pool, so build
+        # the same client it would: project endpoint, Entra bearer token,
+        # api-version query - on top of the shared httpx pool
+        AsyncOpenAI(
+            base_url=f"{project_endpoint}/openai",
+            api_key=get_bearer_token_provider(credential, "https://ai.azure.com/.default"),
+            default_query={"api-version": "2025-11-15-preview"},
+            http_client=http_client,
+        ) as openai_client,
+    ):
+
+        # Upload the phones.csv file (or reuse a cached upload) and create
+        # a CodeInterpreterTool
+        uploaded_file = await upload_phone_data(openai_client, file_path)
+        print(f"Using file {uploaded_file.filename}")
+
+        code_interpreter = CodeInterpreterTool(
+            container=CodeInterpreterToolAuto(file_ids=[uploaded_file.id])
+        )
+
+        # Define an agent that uses the CodeInterpreterTool
+        agent = await project_client.agents.create_version(
+            agent_name="phone-budget-agent",
+            definition=PromptAgentDefinition(
+                model=model_deployment,
+                instructions=(
+                    "You are a phone shopping assistant. Use Python on the attached "
+                    "phones.csv (Brand, Model, Price, Storage, ScreenSize, Battery, "
+                    "CameraMP) to answer questions, showing phone name and price."
+                ),
+                tools=[code_interpreter],
+            ),
+        )
+
+        print(f"Using agent: {agent.name}")
+
+        # Create a conversation for the chat session
+        conversation = await openai_client.conversations.create()
+
+        # Send the initial budget-based query automatically
+        initial_prompt = (
+            f"My budget is ${budget:.2f}. "
+            f"List the phones at or under that price, sorted by price."
+        )
+
+        print(f"\nYou: {initial_prompt}\n")
+
+        response = await stream_response(
+            openai_client, agent, conversation.id, initial_prompt
+        )
+
+        # Check for failure
+        if response.status == "failed":
+            print(f"Response failed: {response.error}")
+
+        # Continue with follow-up questions in a loop
+        log_task = None
+        while True:
+
+            # Read input on a worker thread so the event loop stays free
+            # (keep-alive pings, token refresh) while the user types
+            user_prompt = await asyncio.to_thread(
+                input, "\nAny follow-up questions? (or type 'quit' to exit): "
+            )
+
+            if user_prompt.lower() == "quit":
+                # Start fetching the conversation log in the background
+                log_task = asyncio.create_task(
+                    fetch_conversation_log(openai_client, conversation.id)
+                )
+                break
+
+            if len(user_prompt) == 0:
+                print("Please enter a prompt.")
+                continue
+
+            response = await stream_response(
+                openai_client, agent, conversation.id, user_prompt
+            )
+
+            # Check for failure
+            if response.status == "failed":
+                print(f"Response failed: {response.error}")
+                continue
+
+        # Conversation log
+        print("\nConversation Log:\n")
+
+        for item in await log_task:
+            if item.type == "message":
+                role = item.role.upper()
+                content = item.content[0].text
+                print(f"{role}: {content}\n")
+
+        # Clean up
+        await openai_client.conversations.delete(
+            conversation_id=conversation.id
+        )
+        print("Conversation deleted")
+
+        await project_client.agents.delete_version(
+            agent_name=agent.name,
+            agent_version=agent.version,
+        )
+        print("Agent deleted")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())